@@ -0,0 +1,246 @@
+"""birdweather station check common helpers
+Configuration, logging, JSON and sunrise/sunset helpers shared by the bw-check.py
+launcher and bw_check_main.py. Only light modules are imported here so the
+launcher can decide whether to run at all without loading requests or paho.
+"""
+import sys
+import json
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONFIG_FILENAME = 'bw-check.ini'
+LOG_FILENAME = 'bw-check.log'
+SUN_CACHE_FILENAME = 'bw-check.sun.json'
+# time of this run, shared by everything that compares against "now"
+NOW_UTC = datetime.now(timezone.utc)
+# the default config variables for each section of the config file
+CONFIG_SCHEMA = {
+    'default': {'debug': 'False',
+                'limit_times' : 'True',
+                'sunrise_offset': '-1',
+                'sunset_offset': '1'},
+    'location': {'lat': '46.69',
+                 'lon': '-92.05',
+                 'tz': 'America/Chicago'},
+    'birdweather': {'station_id': '2265',
+                    'url': 'https://app.birdweather.com/graphql'},
+    'mqtt': {'host': '192.168.1.1',
+             'port': '1883',
+             'username': 'mqtt-user',
+             'password': 'mqtt-password',
+             'topic': 'birdweather'}}
+
+# set from the config file by the launcher
+debug = False
+
+
+def new_config(filename, section, config_vars):
+    """Append a new section with its default values to the config file
+    Args:
+        filename (str): Filename of the config file to create or append to.
+        section (str): Header section or title of the config within the file
+        config_vars (dict): Dictionary of variables to add
+    """
+    # only needed the first time the config file is written
+    from configparser import ConfigParser
+    print(log_line(f'Creating new config file {filename} with section {section}'))
+    config = ConfigParser()
+    config[section] = config_vars
+    with open(filename, 'a', encoding='utf-8') as f:
+        config.write(f)
+
+
+def read_ini(filename):
+    """Read a simple INI file into a dictionary of sections
+    Only handles what bw-check.ini needs: [section] headers, key = value or
+    key: value lines and full line # or ; comments. Keys are lower-cased like
+    ConfigParser does, and %% is read as % so existing files keep working.
+    Anything else, like multi-line values, is rejected.
+
+    Args:
+        filename (str): Filename of the config file to read.
+    Returns:
+        dict: Section names mapped to a dictionary of variables, empty if the
+        file does not exist
+    Raises:
+        ValueError: If a line is not a header, comment or key/value pair
+    """
+    sections = {}
+    current = None
+    try:
+        with open(filename, encoding='utf-8-sig') as f:
+            for line_number, raw_line in enumerate(f, start=1):
+                line = raw_line.strip()
+                if not line or line[0] in '#;':
+                    continue
+                if raw_line[0] in ' \t':
+                    raise ValueError(f'{filename} line {line_number}: '
+                                     f'indented or continued lines are not supported')
+                if line[0] == '[' and ']' in line:
+                    current = sections.setdefault(line[1:line.rindex(']')].strip(), {})
+                    continue
+                delimiters = [i for i in (line.find('='), line.find(':')) if i >= 0]
+                if not delimiters:
+                    raise ValueError(f'{filename} line {line_number}: '
+                                     f'expected [section] or key = value, got {line!r}')
+                if current is None:
+                    raise ValueError(f'{filename} line {line_number}: '
+                                     f'{line!r} is not inside a [section]')
+                split_at = min(delimiters)
+                key = line[:split_at].strip().lower()
+                if not key:
+                    raise ValueError(f'{filename} line {line_number}: missing key')
+                # ConfigParser needed % written as %%, keep reading it that way
+                current[key] = line[split_at + 1:].strip().replace('%%', '%')
+    except FileNotFoundError:
+        pass
+    return sections
+
+
+def load_all_config(filename, schema, create=True):
+    """Read every section of the config file in a single pass
+    Any section missing from the file is filled in from its defaults and,
+    if create is True, written back to the file.
+
+    Args:
+        filename (str): Filename of the config file to read.
+        schema (dict): Section names mapped to a dictionary of default variables
+        create (bool): If True, add missing sections to the config file. Default is True.
+    Returns:
+        dict: Section names mapped to a dictionary of variables from the config file
+    """
+    try:
+        config_file = read_ini(filename)
+    except IOError as e:
+        print(f'CONFIG FILE ERROR: {e}')
+        sys.exit()
+    except ValueError as e:
+        print(f'CONFIG FILE VALUE ERROR: {e}')
+        sys.exit()
+    config = {}
+    for section, defaults in schema.items():
+        if section not in config_file:
+            if create:
+                new_config(filename, section, defaults)
+            config[section] = dict(defaults)
+            continue
+        # only take the vars we know about from each section
+        config[section] = {key: config_file[section][key] for key in defaults}
+    return config
+
+
+def json_loads(data):
+    """Parse JSON, using orjson if it is installed
+    Args:
+        data (bytes or str): JSON document to parse
+    Returns:
+        object: Parsed JSON data
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj):
+    """Serialise to compact JSON, using orjson if it is installed
+    Args:
+        obj (object): Data to serialise
+    Returns:
+        str: Compact JSON string
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def log_line(msg):
+    """Prefix a message with the current timestamp
+    Args:
+        msg (str): Message to timestamp
+    Returns:
+        str: Message with timestamp
+    """
+    return f'{datetime.now():%Y-%m-%d %H:%M:%S.%f}: {msg}'
+
+
+def debug_print(msg):
+    """Print debug message if debug is enabled (True)
+    Args:
+        msg (str): Message to print
+    """
+    if debug:
+        print(log_line(msg))
+
+
+def sun_times(latitude, longitude, timezone="America/Chicago"):
+    """Get today's sunrise and sunset times for a location
+    The times only change once a day, so they are cached in SUN_CACHE_FILENAME
+    and the Astral calculation only runs when the date or location changes.
+
+    Args:
+        latitude (float): The latitude of the location
+        longitude (float): The longitude of the location
+        timezone (str): The timezone of the location. Defaults to "America/Chicago".
+    Returns:
+        tuple: Sunrise and sunset datetimes for today
+    """
+    tz = ZoneInfo(timezone)
+    today = datetime.now(tz=tz).date()
+    cache_key = f'{today.isoformat()}|{timezone}|{latitude}|{longitude}'
+    try:
+        with open(SUN_CACHE_FILENAME, encoding='utf-8') as f:
+            cache = json_loads(f.read())
+        if cache['key'] == cache_key:
+            debug_print('Using cached sunrise and sunset times')
+            return (datetime.fromisoformat(cache['sunrise']),
+                    datetime.fromisoformat(cache['sunset']))
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    # imported here so runs that hit the cache never load astral
+    from astral import LocationInfo
+    from astral.sun import sun
+    debug_print('Calculating sunrise and sunset times')
+    city = LocationInfo("custom", "custom", timezone, float(latitude), float(longitude))
+    s = sun(city.observer, today, tzinfo=tz)
+    # the cache is only a shortcut, a failed write just means recalculating next run
+    try:
+        with open(SUN_CACHE_FILENAME, 'w', encoding='utf-8') as f:
+            f.write(json_dumps({'key': cache_key,
+                                'sunrise': s["sunrise"].isoformat(),
+                                'sunset': s["sunset"].isoformat()}))
+    except OSError as e:
+        debug_print(f'Could not write {SUN_CACHE_FILENAME}: {e}')
+    return s["sunrise"], s["sunset"]
+
+
+def between_sunrise_sunset(latitude, longitude, timezone="America/Chicago",
+                           rise_offset=-1, set_offset=1):
+    """Check if the current time is between sunrise and sunset
+    This function uses the Astral library to calculate the sunrise and sunset
+    times for a given location and checks if the current time is between
+    those times. It takes the latitude and longitude of the location,
+    as well as the timezone and offsets for sunrise and sunset. The offsets
+    are in hours and can be positive or negative. The function returns True
+    if the current time is between sunrise and sunset, and False otherwise.
+
+    Args:
+        latitude (float): The latitude of the location
+        longitude (float): The longitude of the location
+        timezone (str): The timezone of the location. Defaults to "America/Chicago".
+        rise_offset (int): The offset for sunrise time in hours. Defaults to -1.
+        set_offset (int): The offset for sunset time in hours. Defaults to 1.
+    Returns:
+        bool: True if the current time is between sunrise and sunset, False otherwise
+    """
+    debug_print('Checking sunrise and sunset times')
+    sunrise, sunset = sun_times(latitude, longitude, timezone)
+    now_time = datetime.now(tz=ZoneInfo(timezone))
+    sunrise_offset_time = sunrise + timedelta(hours=float(rise_offset))
+    sunset_offset_time = sunset + timedelta(hours=float(set_offset))
+    debug_print(f'Sunrise {rise_offset}: {sunrise_offset_time.strftime("%H:%M")}, ' \
+                f'Sunset +{set_offset}: {sunset_offset_time.strftime("%H:%M")}')
+    return sunrise_offset_time < now_time < sunset_offset_time
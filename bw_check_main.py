@@ -0,0 +1,261 @@
+"""birdweather station check main module
+Fetches the station data from the Birdweather API and sends it to an MQTT broker.
+This is imported and run by bw-check.py once it has decided the script should run.
+"""
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from bw_check_common import (LOG_FILENAME, NOW_UTC, debug_print, json_dumps, json_loads,
+                             log_line)
+
+# MQTT subtopics under <topic>/<station name>, in the same order as the payloads
+MQTT_TOPIC_MODS = ('/stats', '/TopHourlySpecies', '/TopDailySpecies', '/TopHourlySpecies/json',
+                   '/TopDailySpecies/json', '/TopHourlySpecies/plain', '/TopDailySpecies/plain', '')
+# GraphQL queries for the top species, the station ID is passed in as a variable
+HOURLY_QUERY = 'query ($id: ID!) {station(id: $id) {coords {lat, lon}, ' \
+    'id, latestDetectionAt, name, topSpecies(limit: 10, period: {count: 1, unit: "hour"}) ' \
+    '{count, species {commonName}, speciesId}}}'
+DAILY_QUERY = 'query ($id: ID!) {station(id: $id) {coords {lat, lon}, ' \
+    'id, latestDetectionAt, name, topSpecies(limit: 40, period: {count: 1, unit: "day"}) ' \
+    '{count, species {commonName}, speciesId}}}'
+# seconds to wait on the MQTT broker to accept the connection and take the messages
+MQTT_TIMEOUT = 10
+
+# one HTTP session for the API requests, fetch_all() sends them at the same time
+session = requests.Session()
+
+class StationData:
+    """ Class to get data from Birdweather API
+    Args:
+        url (str): URL of the Birdweather API
+        station_id (str): ID of the Birdweather station
+        period (float): Time period in hours to determine if the station is online
+        (default is 1.5 hours)
+        query (str): GraphQL query to get data from the Birdweather API, the
+        station ID is passed to it as the $id variable
+        json_name (str): Name of the JSON string to save data to
+    The data is not fetched until the object is passed to fetch_all()
+    """
+    def __init__(self, url, station_id, **kwargs):
+        self.url = url
+        self.station_id = station_id
+        self.period = float(kwargs.get("period") or 1.5)
+        self.query = kwargs.get("query", "")
+        self.variables = {'id': station_id}
+        self.json_name = kwargs.get("json_name", "")
+        self.name, self.last_detect, self.species_list = None, None, []
+        self.status_msg = 'OK'
+
+    def build_query(self):
+        """Build the request body for the Birdweather API
+        Returns:
+            dict: GraphQL query and variables to post to the Birdweather API
+        """
+        return {'query': self.query, 'variables': self.variables}
+
+    def station_data(self, response):
+        """Parse station data from a Birdweather API response
+        Args:
+            response: Response object from the Birdweather API
+        Returns:
+            tuple: Station name, last detection time, and list of (species, count) tuples
+        """
+        data = json_loads(response.content)
+        debug_print('Parsing station data')
+        station_data = data['data']['station']
+        name = station_data['name']
+        # keep the station's own offset for the stats payload, aware datetimes
+        # subtract correctly against NOW_UTC in online() without converting
+        last_detect = datetime.fromisoformat(station_data['latestDetectionAt'])
+        species_list = [(species_data["species"]["commonName"], species_data["count"])
+                        for species_data in station_data['topSpecies']]
+        return name, last_detect, species_list
+
+    def response(self):
+        """Get response from the Birdweather API
+        Returns:
+            response: Response object from the Birdweather API
+        """
+        try:
+            debug_print('Fetching data from Birdweather API')
+            response_data = session.post(self.url, json=self.build_query(), timeout=10)
+        except requests.exceptions.RequestException as e:
+            debug_print('ERROR FETCHING DATA: ' + str(e))
+            self.status_msg = 'ERROR FETCHING DATA: ' + str(e)
+            return None
+        if response_data.status_code != 200:
+            debug_print('BAD RESPONSE: ' + str(response_data.status_code))
+            self.status_msg = 'BAD RESPONSE: ' + str(response_data.status_code)
+            return None
+        debug_print('Data fetched successfully')
+        return response_data
+
+    def online(self):
+        """Check if the station is online based on the last detection time
+        compared to the start of this run (NOW_UTC)
+        Returns:
+            bool: True if the station is online, False otherwise
+        """
+        delta_time = NOW_UTC - self.last_detect
+        delta_hours = delta_time.total_seconds() / 3600.0
+        return delta_hours <= self.period
+
+    @property
+    def species(self):
+        """Convert the species data to a dictionary of species and counts"""
+        return dict(self.species_list)
+
+    @property
+    def json(self):
+        """Convert the species data to JSON format"""
+        top_species_list = [{"name": bird_name, "count": bird_count} for bird_name,
+                            bird_count in self.species_list]
+        return {self.json_name: top_species_list}
+
+    @property
+    def plain(self):
+        """Convert the species data to plain text format"""
+        return '\n'.join(map('{0[0]}: {0[1]}'.format, self.species_list))
+
+
+class MqttSender:
+    """Class to send MQTT messages
+    Args:
+        host (str): Hostname or IP address of the MQTT broker
+        port (int): Port number of the MQTT broker
+        username (str): Username for the MQTT broker
+        password (str): Password for the MQTT broker
+    """
+    def __init__(self, host, port, username, password):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+
+    def send(self, msgs):
+        """Send multiple MQTT messages
+        Args:
+            msgs (list): List of tuples containing topic, payload, qos, and retain
+        Returns:
+            str: Status message
+        """
+        # imported here so runs that exit early never load paho
+        from paho.mqtt import client as mqtt_client
+        debug_print('Sending MQTT messages')
+        try:
+            # one connection for the whole batch, all messages are QoS 0 so
+            # there are no acks to wait on, just flush the socket
+            client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2)
+            client.username_pw_set(self.username, self.password)
+            client.max_inflight_messages_set(len(msgs))
+            connack = []
+            client.on_connect = lambda client, userdata, flags, reason_code, properties: \
+                connack.append(reason_code)
+            client.connect(self.host, self.port)
+            # wait for the CONNACK so a refused login is reported, not dropped
+            deadline = time.monotonic() + MQTT_TIMEOUT
+            while not connack:
+                if time.monotonic() > deadline:
+                    raise TimeoutError('no CONNACK from broker')
+                rc = client.loop(timeout=1.0)
+                if rc != mqtt_client.MQTT_ERR_SUCCESS and not connack:
+                    raise ConnectionError(mqtt_client.error_string(rc))
+            if connack[0].is_failure:
+                raise ConnectionError(f'connection refused: {connack[0]}')
+            for topic, payload, qos, retain in msgs:
+                result = client.publish(topic, payload, qos=qos, retain=retain)
+                if result.rc != mqtt_client.MQTT_ERR_SUCCESS:
+                    raise ConnectionError(mqtt_client.error_string(result.rc))
+            deadline = time.monotonic() + MQTT_TIMEOUT
+            while client.want_write():
+                if time.monotonic() > deadline:
+                    raise TimeoutError('timed out sending messages')
+                rc = client.loop_write()
+                if rc != mqtt_client.MQTT_ERR_SUCCESS:
+                    raise ConnectionError(mqtt_client.error_string(rc))
+            client.disconnect()
+            debug_print('MQTT messages sent')
+            return 'OK'
+        except Exception as e:
+            debug_print(f"MQTT ERROR: {e}")
+            return "MQTT ERROR"
+
+
+def fetch_all(stations):
+    """Fetch and parse data for several StationData objects in parallel
+    A station whose request failed is left without data and keeps the error
+    in its status_msg.
+
+    Args:
+        stations (list): List of StationData objects to fill in
+    """
+    with ThreadPoolExecutor(max_workers=len(stations)) as executor:
+        responses = list(executor.map(StationData.response, stations))
+    for station, response in zip(stations, responses):
+        if response is None:
+            continue
+        station.name, station.last_detect, station.species_list = station.station_data(response)
+
+
+def record_status(msg):
+    """Write the final status message to the log file and the terminal
+    Args:
+        msg (str): Status message to record
+    """
+    debug_print('Writing to log file')
+    last_status = log_line(msg)
+    with open(LOG_FILENAME, 'a', encoding='utf-8') as log_file:
+        log_file.write(last_status + '\n')
+    print(last_status)
+
+
+def run(cfg):
+    """Fetch the station data, send it to MQTT and record the status
+    Args:
+        cfg (dict): Config sections as returned by load_all_config()
+    """
+    birdweather = cfg['birdweather']
+    mqtt = cfg['mqtt']
+    # create hourly and daily StationData objects from the queries
+    hour = StationData(
+        birdweather['url'],
+        birdweather['station_id'],
+        period=12,
+        query=HOURLY_QUERY,
+        json_name='hourlytopspecies')
+    day = StationData(
+        birdweather['url'],
+        birdweather['station_id'],
+        period=12,
+        query=DAILY_QUERY,
+        json_name='dailytopspecies')
+    fetch_all([hour, day])
+    for station in (hour, day):
+        if station.last_detect is None:
+            # nothing to publish without the station data, just record why
+            record_status(station.status_msg)
+            return
+    # check if the station is online
+    online_status_msg = "ONLINE" if hour.online() else "OFFLINE"
+    # build and send the MQTT messages
+    debug_print('Sending MQTT messages')
+    time_now_iso = NOW_UTC.replace(microsecond=0).astimezone()
+    mqtt_topic_base = mqtt['topic'] + '/' + hour.name
+    mqtt_topics = tuple(mqtt_topic_base + mod for mod in MQTT_TOPIC_MODS)
+    mqtt_payloads = [json_dumps({'stationID': hour.station_id,
+                                 'lastDetect': hour.last_detect.isoformat(),
+                                 'timeNow': time_now_iso.isoformat()}),
+                     json_dumps(hour.species),
+                     json_dumps(day.species),
+                     json_dumps(hour.json),
+                     json_dumps(day.json),
+                     hour.plain,
+                     day.plain,
+                     online_status_msg]
+    mqtt_msgs = [(topic, payload, 0, False)
+                 for topic, payload in zip(mqtt_topics, mqtt_payloads)]
+    server = MqttSender(mqtt['host'], mqtt['port'], mqtt['username'], mqtt['password'])
+    status_msg = server.send(mqtt_msgs)
+    # record log message
+    record_status(f'{online_status_msg} - {status_msg}')